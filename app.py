@@ -4,7 +4,7 @@
 # Características:
 # - Registro de pacientes (nombre, documento, teléfono, correo)
 # - Agendar, listar y cancelar citas (fecha, hora, médico)
-# - Interfaz web mínima en HTML/CSS (render_template_string)
+# - Interfaz web mínima en HTML/CSS (plantillas en templates/)
 # - Persistencia en memoria (resetea al reiniciar)
 #
 # Ejecución:
@@ -13,284 +13,298 @@
 #   Navegar a http://127.0.0.1:5000/
 # -------------------------------------------------------------
 
-from flask import Flask, request, redirect, url_for, render_template_string, flash
-from datetime import datetime
-import itertools
+from flask import Flask, request, redirect, url_for, flash, get_flashed_messages, render_template
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+from functools import lru_cache
+import bisect
+import os
+import sys
+
+# MiniJinja (renderizador en Rust) acelera el camino caliente de render;
+# si no está instalado se usa el entorno Jinja precompilado.
+try:
+    from minijinja import Environment as MiniJinjaEnvironment
+except ImportError:
+    MiniJinjaEnvironment = None
+
+# orjson serializa JSON en C varias veces más rápido que el módulo json;
+# si falta, se usa la biblioteca estándar.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
 
 app = Flask(__name__)
 app.secret_key = "demo-academico"  # Necesario para flash messages (académico)
+app.config["TEMPLATES_AUTO_RELOAD"] = False  # no stat() del fuente en cada render
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 31536000  # estáticos cacheables 1 año
 
 # -----------------------------
 # "Base de datos" en memoria
 # -----------------------------
 # Estructuras simples para fines académicos. En producción usar DB real.
 patients = {}        # id -> dict(nombre, documento, telefono, correo)
-appointments = {}    # id -> dict(paciente_id, fecha (YYYY-MM-DD), hora (HH:MM), medico, estado)
-pid_counter = itertools.count(start=1)
-aid_counter = itertools.count(start=1)
+
+# Citas en columnas paralelas (SoA) en vez de dict-de-dicts: los escaneos
+# (ordenar, filtrar) recorren una sola lista contigua por campo sin
+# perseguir punteros ni hashear claves "fecha"/"hora"/"medico" por fila.
+appt_ids = []          # id de cita de cada fila
+appt_paciente_id = []  # id del paciente
+appt_fecha = []        # YYYY-MM-DD
+appt_hora = []         # HH:MM
+appt_medico = []       # nombre tal como se capturó
+appt_medico_norm = []  # nombre normalizado (strip/lower) para comparar
+appt_estado = []       # "Programada"
+appt_pos = {}          # id de cita -> índice de fila (cancelación en O(1))
+_APPT_COLS = (appt_ids, appt_paciente_id, appt_fecha, appt_hora,
+              appt_medico, appt_medico_norm, appt_estado)
+
+conflict_index = {}  # (medico_norm, fecha, hora) -> id de cita (detección de conflictos en O(1))
+per_doctor = {}      # medico_norm -> [(fecha, hora, id)] ordenado (listados filtrados en O(K))
+documento_index = {} # documento normalizado -> id de paciente (unicidad en O(1))
+state_version = 0    # se incrementa en cada mutación; clave de la caché de páginas
+_next_pid = 1        # siguiente id de paciente disponible
+_next_aid = 1        # siguiente id de cita disponible
+
+def alloc_pid() -> int:
+    """Asigna el siguiente id de paciente (int plano, sin generador)."""
+    global _next_pid
+    v = _next_pid
+    _next_pid = v + 1
+    return v
+
+def alloc_aid() -> int:
+    """Asigna el siguiente id de cita."""
+    global _next_aid
+    v = _next_aid
+    _next_aid = v + 1
+    return v
+
+def alloc_pids(k: int) -> range:
+    """Reserva K ids de paciente consecutivos de una vez (cargas masivas)."""
+    global _next_pid
+    start = _next_pid
+    _next_pid = start + k
+    return range(start, start + k)
 
 # Algunos médicos de ejemplo para el selector (puede editarse libremente)
 DEFAULT_DOCTORS = ["Dra. González", "Dr. Pérez", "Dra. Ramírez", "Dr. López"]
 
+# Nombres normalizados internados: el vocabulario de médicos es pequeño y
+# fijo, así que comparar medico_norm entre citas/filtros se resuelve por
+# identidad de puntero y el hash queda cacheado en el propio string.
+DOCTOR_POOL = {d.lower(): sys.intern(d.lower()) for d in DEFAULT_DOCTORS}
+
+def intern_medico(medico: str) -> str:
+    """Normaliza un nombre de médico y devuelve su versión internada."""
+    norm = medico.strip().lower()
+    return DOCTOR_POOL.get(norm) or sys.intern(norm)
+
+# El listado de médicos es constante: sus <option> se escapan y ensamblan
+# una sola vez al importar, en vez de en cada render.
+DOCTOR_OPTIONS = Markup("".join(
+    f'<option value="{escape(m)}">{escape(m)}</option>' for m in DEFAULT_DOCTORS
+))
+# Piezas precalculadas para la variante con atributo selected del filtro.
+_DOCTOR_OPTION_PIECES = [
+    (m, f'<option value="{escape(m)}"', f'>{escape(m)}</option>')
+    for m in DEFAULT_DOCTORS
+]
+
+def doctor_options_with_selected(current: str) -> Markup:
+    """Opciones del filtro; solo alterna el atributo selected por pieza."""
+    return Markup("".join(
+        head + (" selected" if m == current else "") + tail
+        for m, head, tail in _DOCTOR_OPTION_PIECES
+    ))
+
 # -----------------------------
 # Utilidades
 # -----------------------------
-def parse_datetime(date_str: str, time_str: str) -> datetime:
-    """Convierte fecha y hora de formularios a datetime para ordenar/validar."""
-    return datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
+def form_fields(*names: str) -> list:
+    """Lee y recorta (strip) varios campos del formulario de una pasada."""
+    f = request.form
+    return [f.get(n, "").strip() for n in names]
+
+def valid_fecha_hora(fecha: str, hora: str) -> bool:
+    """Valida el patrón YYYY-MM-DD / HH:MM sin construir un datetime.
+
+    Los <input type="date"> y <input type="time"> del navegador ya
+    imponen el formato; aquí basta comprobar longitud, separadores,
+    dígitos y rangos con operaciones sobre ASCII, sin strptime ni
+    objetos datetime intermedios.
+    """
+    if len(fecha) != 10 or fecha[4] != "-" or fecha[7] != "-" or len(hora) != 5 or hora[2] != ":":
+        return False
+    # Solo dígitos ASCII: isdecimal() acepta dígitos Unicode (p.ej. '٢')
+    # que romperían el invariante orden-lexicográfico == orden-cronológico
+    # del listado ordenado y del índice por médico.
+    if not (fecha.isascii() and hora.isascii()):
+        return False
+    if not (fecha[:4].isdecimal() and fecha[5:7].isdecimal() and fecha[8:].isdecimal()
+            and hora[:2].isdecimal() and hora[3:].isdecimal()):
+        return False
+    # Rangos básicos; el calendario fino (días por mes) lo impone el navegador.
+    return (1 <= int(fecha[5:7]) <= 12 and 1 <= int(fecha[8:]) <= 31
+            and int(hora[:2]) < 24 and int(hora[3:]) < 60)
+
+def _has_conflict_no_exclude(medico_norm: str, fecha: str, hora: str) -> bool:
+    """Camino caliente (crear cita): una sola sonda `in` sobre el índice."""
+    return (medico_norm, fecha, hora) in conflict_index
+
+def _has_conflict_excluding(medico_norm: str, fecha: str, hora: str, exclude_id: int) -> bool:
+    """Variante para updates: ignora la cita indicada si es la que choca."""
+    existing = conflict_index.get((medico_norm, fecha, hora))
+    return existing is not None and existing != exclude_id
 
 def has_conflict(medico: str, fecha: str, hora: str, exclude_appointment_id: int = None) -> bool:
     """
     Verifica si ya existe una cita para el mismo médico en la misma fecha y hora.
     Opcionalmente excluye una cita por ID (para futuros updates).
+
+    Despacha una sola vez a la variante con o sin exclusión, en vez de
+    evaluar la condición de exclusión en cada consulta.
+    """
+    medico_norm = intern_medico(medico)
+    if exclude_appointment_id is None:
+        return _has_conflict_no_exclude(medico_norm, fecha, hora)
+    return _has_conflict_excluding(medico_norm, fecha, hora, exclude_appointment_id)
+
+def appt_row(i: int) -> dict:
+    """Materializa la fila i como dict (adaptador SoA -> plantillas)."""
+    return {
+        "paciente_id": appt_paciente_id[i],
+        "fecha": appt_fecha[i],
+        "hora": appt_hora[i],
+        "medico": appt_medico[i],
+        "medico_norm": appt_medico_norm[i],
+        "estado": appt_estado[i],
+    }
+
+# Lista ordenada memoizada: los GET dominan sobre las mutaciones, así que
+# reordenar en cada petición es trabajo repetido. Se invalida (None) al
+# crear o cancelar citas.
+_sorted_cache = None
+
+def upcoming_sorted() -> list:
+    """Devuelve la lista de citas ordenada por fecha/hora ascendente.
+
+    Como fecha es YYYY-MM-DD y hora es HH:MM, el orden lexicográfico de
+    las cadenas coincide con el cronológico: se ordenan los índices de
+    fila sin parsear nada, y solo las filas visibles se materializan como
+    dicts. El resultado se cachea hasta la siguiente mutación.
+    """
+    global _sorted_cache
+    if _sorted_cache is None:
+        order = sorted(range(len(appt_ids)), key=lambda i: (appt_fecha[i], appt_hora[i]))
+        _sorted_cache = [(appt_ids[i], appt_row(i)) for i in order]
+    return _sorted_cache
+
+def doctor_sorted(medico_norm: str) -> list:
+    """Citas de un médico ya ordenadas por fecha/hora, desde su índice.
+
+    per_doctor se mantiene ordenado con bisect.insort en cada alta, así
+    que un listado filtrado cuesta O(K) del médico en cuestión en vez de
+    ordenar y recorrer la agenda completa.
     """
-    for a_id, a in appointments.items():
-        if exclude_appointment_id and a_id == exclude_appointment_id:
-            continue
-        if a["medico"].strip().lower() == medico.strip().lower() and a["fecha"] == fecha and a["hora"] == hora:
-            return True
-    return False
-
-def upcoming_sorted(aps: dict) -> list:
-    """Devuelve la lista de citas ordenada por fecha/hora ascendente."""
-    def keyfun(item):
-        _, a = item
-        return parse_datetime(a["fecha"], a["hora"])
-    return sorted(aps.items(), key=keyfun)
+    return [(a_id, appt_row(appt_pos[a_id]))
+            for _fecha, _hora, a_id in per_doctor.get(medico_norm, [])]
+
+
+# -----------------------------
+# Plantillas precompiladas
+# -----------------------------
+# Las páginas viven en templates/*.html y heredan de base.html vía
+# {% extends %}, así cada respuesta es un único render. Flask cachea los
+# Template compilados por nombre de archivo, cosa que nunca hacía con
+# render_template_string. MiniJinja recibe las mismas fuentes leídas una
+# sola vez al importar.
+_env = app.jinja_env
+_env.auto_reload = False
+# Bytecode compilado persistido en disco: los workers nuevos (p.ej. cada
+# proceso de gunicorn) cargan las plantillas sin recompilarlas.
+_env.bytecode_cache = FileSystemBytecodeCache()
+
+def _template_sources() -> dict:
+    """Lee el fuente de cada plantilla de templates/ (solo al importar)."""
+    sources = {}
+    for name in ("base.html", "home.html", "patients.html"):
+        with open(os.path.join(app.root_path, "templates", name), encoding="utf-8") as f:
+            sources[name] = f.read()
+    return sources
+
+if MiniJinjaEnvironment is not None:
+    _mj_env = MiniJinjaEnvironment(templates=_template_sources())
+
+    def render_page(name: str, **context) -> str:
+        return _mj_env.render_template(name, **context)
+else:
+    def render_page(name: str, **context) -> str:
+        return render_template(name, **context)
 
 # -----------------------------
-# Plantillas (HTML+CSS simples)
+# Caché de páginas renderizadas
 # -----------------------------
-BASE_HTML = """
-<!doctype html>
-<html lang="es">
-<head>
-  <meta charset="utf-8">
-  <title>Agenda de Citas Médicas</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1" />
-  <style>
-    :root { --c1:#0ea5e9; --c2:#0369a1; --ok:#16a34a; --err:#dc2626; --bg:#f8fafc; }
-    body { font-family: system-ui, Arial, sans-serif; background: var(--bg); margin:0; color:#0f172a; }
-    header { background: linear-gradient(90deg, var(--c1), var(--c2)); color:white; padding:16px 20px; }
-    header h1 { margin:0; font-size:1.25rem; }
-    nav a { color:white; text-decoration:none; margin-right:12px; }
-    .container { max-width: 1100px; margin: 20px auto; padding: 0 16px; }
-    .card { background:white; border:1px solid #e2e8f0; border-radius:12px; padding:16px; box-shadow: 0 1px 2px rgba(0,0,0,.04); }
-    .grid { display:grid; gap:16px; }
-    .grid-2 { grid-template-columns: 1fr 1fr; }
-    .grid-3 { grid-template-columns: 1fr 1fr 1fr; }
-    table { width:100%; border-collapse: collapse; }
-    th, td { text-align:left; padding:10px; border-bottom:1px solid #e2e8f0; }
-    th { background:#f1f5f9; }
-    .btn { display:inline-block; padding:8px 12px; border-radius:8px; border:1px solid #e2e8f0; background:#fff; cursor:pointer; }
-    .btn.primary { background: var(--c1); color:white; border-color: transparent; }
-    .btn.danger { background: var(--err); color:white; border-color: transparent; }
-    .btn.ok { background: var(--ok); color:white; border-color: transparent; }
-    .field { display:flex; flex-direction:column; margin-bottom:10px; }
-    .field label { font-size:.9rem; color:#334155; margin-bottom:6px; }
-    .field input, .field select { padding:10px; border:1px solid #cbd5e1; border-radius:8px; }
-    .muted { color:#64748b; font-size:.9rem; }
-    .flash { padding:10px 12px; border-radius:8px; margin-bottom:10px; }
-    .flash.ok { background:#dcfce7; color:#166534; }
-    .flash.err { background:#fee2e2; color:#991b1b; }
-    footer { text-align:center; color:#64748b; padding:20px 0 40px; }
-    @media (max-width: 900px) { .grid-2, .grid-3 { grid-template-columns: 1fr; } }
-  </style>
-</head>
-<body>
-  <header>
-    <div class="container" style="display:flex; align-items:center; justify-content:space-between;">
-      <h1>Agenda de Citas Médicas</h1>
-      <nav>
-        <a href="{{ url_for('home') }}">Agenda</a>
-        <a href="{{ url_for('patients_page') }}">Pacientes</a>
-      </nav>
-    </div>
-  </header>
-
-  <main class="container">
-    {% with messages = get_flashed_messages(with_categories=true) %}
-      {% if messages %}
-        {% for cat, msg in messages %}
-          <div class="flash {{ 'ok' if cat=='ok' else 'err' }}">{{ msg }}</div>
-        {% endfor %}
-      {% endif %}
-    {% endwith %}
-    {{ content|safe }}
-  </main>
-
-  <footer>
-    <p class="muted">Prototipo académico &mdash; Flask monolítico, memoria volátil.</p>
-  </footer>
-</body>
-</html>
-"""
-
-HOME_HTML = """
-<div class="grid grid-2">
-  <section class="card">
-    <h2 style="margin-top:0;">Agendar nueva cita</h2>
-    {% if not patients %}
-      <p class="muted">Primero registra al menos un paciente en la pestaña <b>Pacientes</b>.</p>
-    {% else %}
-    <form method="post" action="{{ url_for('create_appointment') }}">
-      <div class="field">
-        <label>Paciente</label>
-        <select name="paciente_id" required>
-          <option value="" selected disabled>Selecciona un paciente...</option>
-          {% for p_id, p in patients.items() %}
-            <option value="{{ p_id }}">{{ p['nombre'] }} ({{ p['documento'] }})</option>
-          {% endfor %}
-        </select>
-      </div>
-      <div class="grid grid-3">
-        <div class="field">
-          <label>Fecha</label>
-          <input type="date" name="fecha" required>
-        </div>
-        <div class="field">
-          <label>Hora</label>
-          <input type="time" name="hora" required>
-        </div>
-        <div class="field">
-          <label>Médico</label>
-          <select name="medico" required>
-            <option value="" selected disabled>Selecciona...</option>
-            {% for m in doctors %}
-              <option value="{{ m }}">{{ m }}</option>
-            {% endfor %}
-          </select>
-        </div>
-      </div>
-      <button class="btn primary" type="submit">Agendar</button>
-    </form>
-    {% endif %}
-    <p class="muted" style="margin-top:8px;">El sistema valida conflictos por médico (misma fecha y hora no permitida).</p>
-  </section>
-
-  <section class="card">
-    <h2 style="margin-top:0;">Filtrar agenda por médico</h2>
-    <form method="get" action="{{ url_for('home') }}">
-      <div class="grid grid-3">
-        <div class="field">
-          <label>Médico</label>
-          <select name="medico">
-            <option value="">Todos</option>
-            {% for m in doctors %}
-              <option value="{{ m }}" {{ 'selected' if request.args.get('medico')==m else '' }}>{{ m }}</option>
-            {% endfor %}
-          </select>
-        </div>
-      </div>
-      <button class="btn" type="submit">Aplicar filtro</button>
-      {% if request.args.get('medico') %}
-        <a class="btn" href="{{ url_for('home') }}">Limpiar</a>
-      {% endif %}
-    </form>
-  </section>
-</div>
-
-<section class="card" style="margin-top:16px;">
-  <h2 style="margin-top:0;">Citas programadas</h2>
-  {% if not appts %}
-    <p class="muted">No hay citas programadas aún.</p>
-  {% else %}
-  <div style="overflow-x:auto;">
-    <table>
-      <thead>
-        <tr>
-          <th>ID</th>
-          <th>Fecha</th>
-          <th>Hora</th>
-          <th>Médico</th>
-          <th>Paciente</th>
-          <th>Documento</th>
-          <th>Acciones</th>
-        </tr>
-      </thead>
-      <tbody>
-        {% for a_id, a in appts %}
-          {% set p = patients.get(a['paciente_id']) %}
-          <tr>
-            <td>#{{ a_id }}</td>
-            <td>{{ a['fecha'] }}</td>
-            <td>{{ a['hora'] }}</td>
-            <td>{{ a['medico'] }}</td>
-            <td>{{ p['nombre'] if p else '—' }}</td>
-            <td>{{ p['documento'] if p else '—' }}</td>
-            <td>
-              <form method="post" action="{{ url_for('cancel_appointment', appointment_id=a_id) }}" onsubmit="return confirm('¿Cancelar la cita #{{a_id}}?');" style="display:inline;">
-                <button class="btn danger" type="submit">Cancelar</button>
-              </form>
-            </td>
-          </tr>
-        {% endfor %}
-      </tbody>
-    </table>
-  </div>
-  {% endif %}
-</section>
-"""
-
-PATIENTS_HTML = """
-<div class="grid grid-2">
-  <section class="card">
-    <h2 style="margin-top:0;">Registrar paciente</h2>
-    <form method="post" action="{{ url_for('create_patient') }}">
-      <div class="field">
-        <label>Nombre completo</label>
-        <input type="text" name="nombre" placeholder="Ej: Ana María Ruiz" required>
-      </div>
-      <div class="field">
-        <label>Documento</label>
-        <input type="text" name="documento" placeholder="CC / DNI / Pasaporte" required>
-      </div>
-      <div class="field">
-        <label>Teléfono</label>
-        <input type="tel" name="telefono" placeholder="Ej: +57 300 123 45 67" required>
-      </div>
-      <div class="field">
-        <label>Correo</label>
-        <input type="email" name="correo" placeholder="ejemplo@correo.com" required>
-      </div>
-      <button class="btn primary" type="submit">Registrar</button>
-    </form>
-    <p class="muted" style="margin-top:8px;">El documento debe ser único. Si ya existe, se mostrará un mensaje.</p>
-  </section>
-
-  <section class="card">
-    <h2 style="margin-top:0;">Pacientes registrados</h2>
-    {% if not patients %}
-      <p class="muted">Aún no hay pacientes.</p>
-    {% else %}
-      <div style="overflow-x:auto;">
-        <table>
-          <thead>
-            <tr>
-              <th>ID</th>
-              <th>Nombre</th>
-              <th>Documento</th>
-              <th>Teléfono</th>
-              <th>Correo</th>
-            </tr>
-          </thead>
-          <tbody>
-            {% for p_id, p in patients.items() %}
-              <tr>
-                <td>#{{ p_id }}</td>
-                <td>{{ p['nombre'] }}</td>
-                <td>{{ p['documento'] }}</td>
-                <td>{{ p['telefono'] }}</td>
-                <td>{{ p['correo'] }}</td>
-              </tr>
-            {% endfor %}
-          </tbody>
-        </table>
-      </div>
-    {% endif %}
-  </section>
-</div>
-"""
+# Entre mutaciones, el HTML de cada página es función pura de
+# (state_version, filtro). Los mensajes flash sí cambian por petición,
+# así que base.html deja el marcador __FLASH__ y se interpola después
+# de consultar la caché.
+def render_rows(appts: list, pats: dict) -> Markup:
+    """Construye las filas <tr> de la tabla de citas en Python puro.
+
+    El bucle {% for %} de Jinja despacha nodo a nodo en el intérprete;
+    concatenar f-strings ya escapadas corre en C y para listados largos
+    es la parte más pesada del render. El resultado es Markup, así que
+    la plantilla lo inserta sin re-escapar.
+    """
+    parts = []
+    for a_id, a in appts:
+        p = pats.get(a["paciente_id"])
+        nombre = escape(p["nombre"]) if p else "—"
+        documento = escape(p["documento"]) if p else "—"
+        cancel_url = url_for("cancel_appointment", appointment_id=a_id)
+        parts.append(
+            f'<tr><td>#{a_id}</td><td>{a["fecha"]}</td><td>{a["hora"]}</td>'
+            f'<td>{escape(a["medico"])}</td><td>{nombre}</td><td>{documento}</td>'
+            f'<td><form method="post" action="{cancel_url}" '
+            f"onsubmit=\"return confirm('¿Cancelar la cita #{a_id}?');\" style=\"display:inline;\">"
+            f'<button class="btn danger" type="submit">Cancelar</button></form></td></tr>'
+        )
+    return Markup("".join(parts))
+
+def _flash_html() -> str:
+    """Construye los <div class="flash"> de la petición actual (no cacheable)."""
+    messages = get_flashed_messages(with_categories=True)
+    return "".join(
+        f'<div class="flash {"ok" if cat == "ok" else "err"}">{escape(msg)}</div>'
+        for cat, msg in messages
+    )
+
+@lru_cache(maxsize=32)
+def _render_home(version: int, medico_filter: str) -> str:
+    if medico_filter:
+        # El índice por médico ya está ordenado: ni sort global ni filtrado.
+        ordered = doctor_sorted(intern_medico(medico_filter))
+    else:
+        ordered = upcoming_sorted()
+    # url_for y un `request` plano van en el contexto para que MiniJinja
+    # (que no conoce los globals de Flask) renderice igual que Jinja.
+    return render_page(
+        "home.html",
+        patients=patients,
+        appts=ordered,
+        rows_html=render_rows(ordered, patients),
+        doctor_options=DOCTOR_OPTIONS,
+        doctor_options_filter=doctor_options_with_selected(medico_filter),
+        url_for=url_for,
+        request={"args": {"medico": medico_filter}}
+    )
+
+@lru_cache(maxsize=8)
+def _render_patients(version: int) -> str:
+    return render_page("patients.html", patients=patients, url_for=url_for)
 
 # -----------------------------
 # Rutas
@@ -298,60 +312,79 @@ PATIENTS_HTML = """
 @app.route("/")
 def home():
     medico_filter = request.args.get("medico", "").strip()
-    # Ordenar citas por fecha/hora
-    ordered = upcoming_sorted(appointments)
-    if medico_filter:
-        ordered = [(i, a) for (i, a) in ordered if a["medico"].strip().lower() == medico_filter.strip().lower()]
-    content = render_template_string(
-        HOME_HTML,
-        patients=patients,
-        appts=ordered,
-        doctors=DEFAULT_DOCTORS
-    )
-    return render_template_string(BASE_HTML, content=content)
+    html = _render_home(state_version, medico_filter)
+    return html.replace("__FLASH__", _flash_html(), 1)
 
 @app.route("/patients")
 def patients_page():
-    content = render_template_string(PATIENTS_HTML, patients=patients)
-    return render_template_string(BASE_HTML, content=content)
+    html = _render_patients(state_version)
+    return html.replace("__FLASH__", _flash_html(), 1)
+
+@app.route("/api/appointments")
+def api_appointments():
+    """Listado de citas en JSON para el refresco del filtro vía fetch.
+
+    Cambiar el filtro ya no re-renderiza la página completa en el
+    servidor: el cliente pide este payload mínimo y reconstruye solo el
+    <tbody>, sin trabajo de plantillas.
+    """
+    medico_filter = request.args.get("medico", "").strip()
+    if medico_filter:
+        ordered = doctor_sorted(intern_medico(medico_filter))
+    else:
+        ordered = upcoming_sorted()
+    payload = []
+    for a_id, a in ordered:
+        p = patients.get(a["paciente_id"])
+        payload.append({
+            "id": a_id,
+            "fecha": a["fecha"],
+            "hora": a["hora"],
+            "medico": a["medico"],
+            "paciente": p["nombre"] if p else None,
+            "documento": p["documento"] if p else None,
+            "estado": a["estado"],
+        })
+    body = orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode("utf-8")
+    return app.response_class(body, mimetype="application/json")
 
 @app.route("/patients", methods=["POST"])
 def create_patient():
-    nombre = request.form.get("nombre", "").strip()
-    documento = request.form.get("documento", "").strip()
-    telefono = request.form.get("telefono", "").strip()
-    correo = request.form.get("correo", "").strip()
+    global state_version
+    nombre, documento, telefono, correo = form_fields("nombre", "documento", "telefono", "correo")
 
-    # Validaciones mínimas
-    if not all([nombre, documento, telefono, correo]):
+    # Validaciones mínimas (and encadenado: corta en el primer vacío sin
+    # construir la lista intermedia de all([...]))
+    if not (nombre and documento and telefono and correo):
         flash("Todos los campos son obligatorios.", "err")
         return redirect(url_for("patients_page"))
 
-    # Documento único
-    for p in patients.values():
-        if p["documento"].strip().lower() == documento.lower():
-            flash("Ya existe un paciente con ese documento.", "err")
-            return redirect(url_for("patients_page"))
+    # Documento único: una consulta al índice en vez de recorrer pacientes
+    doc_norm = documento.lower()
+    if doc_norm in documento_index:
+        flash("Ya existe un paciente con ese documento.", "err")
+        return redirect(url_for("patients_page"))
 
-    p_id = next(pid_counter)
+    p_id = alloc_pid()
     patients[p_id] = {
         "nombre": nombre,
         "documento": documento,
         "telefono": telefono,
         "correo": correo
     }
+    documento_index[doc_norm] = p_id
+    state_version += 1
     flash(f"Paciente #{p_id} registrado correctamente.", "ok")
     return redirect(url_for("patients_page"))
 
 @app.route("/appointments", methods=["POST"])
 def create_appointment():
+    global _sorted_cache, state_version
     try:
         paciente_id = int(request.form.get("paciente_id", "0"))
     except ValueError:
         paciente_id = 0
-    fecha = request.form.get("fecha", "").strip()
-    hora = request.form.get("hora", "").strip()
-    medico = request.form.get("medico", "").strip()
+    fecha, hora, medico = form_fields("fecha", "hora", "medico")
 
     # Validaciones mínimas
     if paciente_id not in patients:
@@ -359,9 +392,7 @@ def create_appointment():
         return redirect(url_for("home"))
 
     # Validar formato fecha/hora
-    try:
-        _ = parse_datetime(fecha, hora)
-    except Exception:
+    if not valid_fecha_hora(fecha, hora):
         flash("Fecha u hora con formato inválido.", "err")
         return redirect(url_for("home"))
 
@@ -369,29 +400,54 @@ def create_appointment():
         flash("Debe seleccionar un médico.", "err")
         return redirect(url_for("home"))
 
-    # Validar conflicto de agenda (médico/fecha/hora)
-    if has_conflict(medico, fecha, hora):
+    # Validar conflicto de agenda (médico/fecha/hora); aquí nunca hay
+    # exclusión, así que se llama directo a la variante sin exclude.
+    medico_norm = intern_medico(medico)
+    if _has_conflict_no_exclude(medico_norm, fecha, hora):
         flash("Conflicto de agenda: ese médico ya tiene una cita en ese horario.", "err")
         return redirect(url_for("home"))
 
-    a_id = next(aid_counter)
-    appointments[a_id] = {
-        "paciente_id": paciente_id,
-        "fecha": fecha,
-        "hora": hora,
-        "medico": medico,
-        "estado": "Programada"
-    }
+    a_id = alloc_aid()
+    appt_pos[a_id] = len(appt_ids)
+    appt_ids.append(a_id)
+    appt_paciente_id.append(paciente_id)
+    appt_fecha.append(fecha)
+    appt_hora.append(hora)
+    appt_medico.append(medico)
+    appt_medico_norm.append(medico_norm)
+    appt_estado.append("Programada")
+    conflict_index[(medico_norm, fecha, hora)] = a_id
+    bisect.insort(per_doctor.setdefault(medico_norm, []), (fecha, hora, a_id))
+    _sorted_cache = None
+    state_version += 1
     flash(f"Cita #{a_id} creada correctamente.", "ok")
     return redirect(url_for("home"))
 
 @app.route("/appointments/<int:appointment_id>/cancel", methods=["POST"])
 def cancel_appointment(appointment_id: int):
-    if appointment_id not in appointments:
+    global _sorted_cache, state_version
+    if appointment_id not in appt_pos:
         flash("La cita no existe.", "err")
         return redirect(url_for("home"))
     # Estrategia simple: eliminar. Alternativa: marcar estado "Cancelada".
-    del appointments[appointment_id]
+    # Borrado por intercambio: la última fila ocupa el hueco y cada
+    # columna hace un solo pop, sin desplazar el resto de la lista.
+    i = appt_pos.pop(appointment_id)
+    conflict_index.pop((appt_medico_norm[i], appt_fecha[i], appt_hora[i]), None)
+    # Quitar la entrada del índice por médico (búsqueda binaria + pop local)
+    entries = per_doctor.get(appt_medico_norm[i], [])
+    j = bisect.bisect_left(entries, (appt_fecha[i], appt_hora[i], appointment_id))
+    if j < len(entries) and entries[j][2] == appointment_id:
+        entries.pop(j)
+    last = len(appt_ids) - 1
+    if i != last:
+        for col in _APPT_COLS:
+            col[i] = col[last]
+        appt_pos[appt_ids[i]] = i
+    for col in _APPT_COLS:
+        col.pop()
+    _sorted_cache = None
+    state_version += 1
     flash(f"Cita #{appointment_id} cancelada.", "ok")
     return redirect(url_for("home"))
 
@@ -399,16 +455,27 @@ def cancel_appointment(appointment_id: int):
 # Datos semilla (opcional)
 # -----------------------------
 def seed_demo():
-    """Registra 2 pacientes de muestra para agilizar la demo."""
-    if not patients:
-        p1 = next(pid_counter)
-        patients[p1] = {"nombre": "Juan Pérez", "documento": "CC-1001", "telefono": "3000000001", "correo": "juan@example.com"}
-        p2 = next(pid_counter)
-        patients[p2] = {"nombre": "Ana Ruiz", "documento": "CC-1002", "telefono": "3000000002", "correo": "ana@example.com"}
+    """Registra 2 pacientes de muestra para agilizar la demo.
+
+    Construye el lote completo y lo inserta con un único dict.update por
+    estructura, en vez de asignaciones sueltas (menos rehashes si el
+    dataset de demo crece).
+    """
+    if patients:
+        return
+    records = [
+        {"nombre": "Juan Pérez", "documento": "CC-1001", "telefono": "3000000001", "correo": "juan@example.com"},
+        {"nombre": "Ana Ruiz", "documento": "CC-1002", "telefono": "3000000002", "correo": "ana@example.com"},
+    ]
+    batch = dict(zip(alloc_pids(len(records)), records))
+    patients.update(batch)
+    documento_index.update({rec["documento"].lower(): p_id for p_id, rec in batch.items()})
 
 # -----------------------------
 # Main
 # -----------------------------
 if __name__ == "__main__":
     seed_demo()
-    app.run(debug=True)
+    # debug=True activa el reloader y desactiva la caché de plantillas;
+    # solo se habilita explícitamente vía FLASK_DEBUG=1.
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1")